@@ -1,21 +1,35 @@
 # backend/main.py
-from fastapi import FastAPI, UploadFile, File, HTTPException, Depends
+from fastapi import FastAPI, UploadFile, File, HTTPException, Depends, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import OAuth2PasswordBearer
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi.responses import JSONResponse, FileResponse, Response
 from fastapi.staticfiles import StaticFiles
 from typing import List, Optional
+from contextlib import asynccontextmanager, closing, contextmanager, suppress
+import asyncio
+import glob
+import hashlib
+import json
+import logging
 import os
+import queue
 import sqlite3
 import uuid
 from datetime import datetime
-import ollama
+from functools import lru_cache
+from io import BytesIO
+from types import MappingProxyType
+import aiofiles
+import aiofiles.os
+from ollama import AsyncClient
+from PIL import Image
 from pydantic import BaseModel
 from reportlab.lib.pagesizes import letter
 from reportlab.pdfgen import canvas
 from reportlab.lib.utils import ImageReader
 
 app = FastAPI(title="Car Insurance Validator Pro")
+logger = logging.getLogger(__name__)
 
 # CORS setup
 app.add_middleware(
@@ -30,47 +44,178 @@ app.add_middleware(
 DATABASE = "insurance.db"
 
 def get_db():
-    conn = sqlite3.connect(DATABASE)
+    conn = sqlite3.connect(DATABASE, check_same_thread=False, isolation_level=None, timeout=5.0)
     conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute("PRAGMA busy_timeout = 5000")
+    conn.execute("PRAGMA cache_size = -20000")
+    conn.execute("PRAGMA temp_store = MEMORY")
     return conn
 
-def init_db():
-    with get_db() as conn:
-        conn.execute("""
-        CREATE TABLE IF NOT EXISTS users (
-            id TEXT PRIMARY KEY,
-            email TEXT UNIQUE,
-            hashed_password TEXT,
-            full_name TEXT,
-            created_at TEXT
-        )
-        """)
-        conn.execute("""
-        CREATE TABLE IF NOT EXISTS submissions (
-            id TEXT PRIMARY KEY,
-            user_id TEXT,
-            vehicle_make TEXT,
-            vehicle_model TEXT,
-            vehicle_year INTEGER,
-            status TEXT,
-            created_at TEXT,
-            FOREIGN KEY(user_id) REFERENCES users(id)
+def column_type(conn, table: str, column: str) -> Optional[str]:
+    """Return the declared type of a column, or None if it doesn't exist"""
+    for row in conn.execute(f"PRAGMA table_info({table})"):
+        if row['name'] == column:
+            return row['type']
+    return None
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    id BLOB PRIMARY KEY,
+    email TEXT UNIQUE,
+    hashed_password TEXT,
+    full_name TEXT,
+    created_at TEXT
+);
+CREATE TABLE IF NOT EXISTS submissions (
+    id BLOB PRIMARY KEY,
+    user_id TEXT,
+    vehicle_make TEXT,
+    vehicle_model TEXT,
+    vehicle_year INTEGER,
+    status TEXT,
+    created_at TEXT,
+    last_modified TEXT,
+    FOREIGN KEY(user_id) REFERENCES users(id)
+);
+CREATE TABLE IF NOT EXISTS submission_images (
+    id BLOB PRIMARY KEY,
+    submission_id BLOB,
+    image_type TEXT,
+    image_path TEXT,
+    thumb_path TEXT,
+    validation_result INTEGER,
+    validation_reason TEXT,
+    FOREIGN KEY(submission_id) REFERENCES submissions(id)
+);
+CREATE INDEX IF NOT EXISTS idx_submission_images_sub ON submission_images(submission_id);
+CREATE INDEX IF NOT EXISTS idx_submissions_user ON submissions(user_id);
+-- Reports are cached per last_modified, so new images must bump it
+CREATE TRIGGER IF NOT EXISTS submission_images_touch
+AFTER INSERT ON submission_images
+BEGIN
+    UPDATE submissions SET last_modified = strftime('%Y-%m-%dT%H:%M:%f', 'now')
+    WHERE id = NEW.submission_id;
+END;
+"""
+
+def legacy_migrations(conn) -> tuple:
+    """SQL to run before and after SCHEMA to upgrade a database from an older version"""
+    before, after = [], []
+    if column_type(conn, "submissions", "id") and not column_type(conn, "submissions", "last_modified"):
+        before.append("ALTER TABLE submissions ADD COLUMN last_modified TEXT;")
+    
+    images_result_type = column_type(conn, "submission_images", "validation_result")
+    if images_result_type == "TEXT":
+        # validation_result used to hold 'yes'/'no' in a TEXT column; the column
+        # affinity can't be changed in place, so the table is rebuilt by SCHEMA.
+        # Its index and trigger would follow the rename, so drop them first.
+        before.append(
+            "DROP INDEX IF EXISTS idx_submission_images_sub;"
+            "DROP TRIGGER IF EXISTS submission_images_touch;"
+            "ALTER TABLE submission_images RENAME TO submission_images_old;"
         )
-        """)
-        conn.execute("""
-        CREATE TABLE IF NOT EXISTS submission_images (
-            id TEXT PRIMARY KEY,
-            submission_id TEXT,
-            image_type TEXT,
-            image_path TEXT,
-            validation_result TEXT,
-            validation_reason TEXT,
-            FOREIGN KEY(submission_id) REFERENCES submissions(id)
+        after.append(
+            "INSERT INTO submission_images "
+            "(id, submission_id, image_type, image_path, validation_result, validation_reason) "
+            "SELECT id, submission_id, image_type, image_path, "
+            "CASE validation_result WHEN 'yes' THEN 1 ELSE 0 END, validation_reason "
+            "FROM submission_images_old;"
+            "DROP TABLE submission_images_old;"
         )
-        """)
+    elif images_result_type and not column_type(conn, "submission_images", "thumb_path"):
+        before.append("ALTER TABLE submission_images ADD COLUMN thumb_path TEXT;")
+    
+    return "".join(before), "".join(after)
+
+def init_db():
+    with closing(get_db()) as conn:
+        # WAL is stored in the database file, so it only has to be set once
+        conn.execute("PRAGMA journal_mode = WAL")
+        before, after = legacy_migrations(conn)
+        # One transaction for the whole schema, so a fresh database costs a single commit
+        conn.executescript(f"BEGIN; {before} {SCHEMA} {after} COMMIT;")
+        conn.execute("ANALYZE")
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
 
 init_db()
 
+class ConnectionPool:
+    """A single writer connection plus a fixed set of reader connections"""
+
+    def __init__(self, readers: int):
+        self.writer = get_db()
+        self.write_lock = asyncio.Lock()
+        self._readers = queue.Queue()
+        for _ in range(readers):
+            self._readers.put(get_db())
+
+    @contextmanager
+    def reader(self):
+        conn = self._readers.get()
+        try:
+            yield conn
+        finally:
+            self._readers.put(conn)
+
+    @asynccontextmanager
+    async def transaction(self):
+        async with self.write_lock:
+            self.writer.execute("BEGIN IMMEDIATE")
+            try:
+                yield self.writer
+            except BaseException:
+                self.writer.execute("ROLLBACK")
+                raise
+            self.writer.execute("COMMIT")
+
+    def close(self):
+        self.writer.close()
+        while not self._readers.empty():
+            self._readers.get_nowait().close()
+
+pool: Optional[ConnectionPool] = None
+
+@app.on_event("startup")
+async def open_pool():
+    global pool
+    pool = ConnectionPool(readers=os.cpu_count() or 4)
+
+async def warm_up_model():
+    """Load the model into memory so the first upload doesn't pay for it"""
+    try:
+        await asyncio.wait_for(
+            app.state.ollama.generate(model=MODEL, prompt='', keep_alive=OLLAMA_KEEP_ALIVE),
+            OLLAMA_WARMUP_TIMEOUT
+        )
+    except asyncio.TimeoutError:
+        logger.warning("Ollama did not load %s within %s seconds", MODEL, OLLAMA_WARMUP_TIMEOUT)
+    except Exception:
+        logger.exception("Could not load %s from Ollama; image validation will fail until it is available", MODEL)
+
+@app.on_event("startup")
+async def open_ollama_client():
+    # One client for the app's lifetime keeps the HTTP connection to Ollama alive
+    app.state.ollama = AsyncClient()
+    # Warm up in the background so a slow or hung daemon can't hold up startup
+    app.state.ollama_warmup = asyncio.create_task(warm_up_model())
+
+@app.on_event("shutdown")
+async def close_ollama_client():
+    app.state.ollama_warmup.cancel()
+
+@app.on_event("shutdown")
+async def close_pool():
+    pool.close()
+
+def get_reader():
+    """Borrow a pooled read-only connection"""
+    return pool.reader()
+
+def get_writer():
+    """Run the enclosed statements in a single write transaction"""
+    return pool.transaction()
+
 # Models
 class UserCreate(BaseModel):
     email: str
@@ -96,6 +241,22 @@ oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 # Configuration
 UPLOAD_FOLDER = "uploads"
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+UPLOAD_CHUNK_SIZE = 1 << 20
+# Quantized LLaVA; on CPU-only hosts a q5_K_M variant keeps more accuracy
+MODEL = os.getenv("LLAVA_MODEL", "llava:7b-v1.6-mistral-q4_K_M")
+# LLaVA is trained on one image per prompt and returns well-formed but unreliable
+# answers for several, so batched validation is opt-in for those models
+BATCH_VALIDATION = os.getenv(
+    "OLLAMA_BATCH_VALIDATION", "0" if MODEL.startswith(("llava", "bakllava")) else "1"
+) == "1"
+# Keep the model loaded indefinitely; every request resets Ollama's unload timer
+OLLAMA_KEEP_ALIVE = -1
+OLLAMA_WARMUP_TIMEOUT = float(os.getenv("OLLAMA_WARMUP_TIMEOUT", "120"))
+# Parallel LLaVA requests contend for the same GPU, so cap them
+OLLAMA_SEM = asyncio.Semaphore(int(os.getenv("OLLAMA_MAX_CONCURRENCY", "2")))
+THUMBNAIL_SIZE = (400, 300)
+REPORTS_FOLDER = "reports"
+os.makedirs(REPORTS_FOLDER, exist_ok=True)
 
 IMAGE_REQUIREMENTS = [
     {"type": "front", "label": "Front View", "description": "Clear view of the front of the vehicle"},
@@ -107,55 +268,199 @@ IMAGE_REQUIREMENTS = [
     {"type": "vin", "label": "VIN Plate", "description": "Clear photo of the vehicle identification number"},
     {"type": "registration", "label": "Registration", "description": "Current vehicle registration document"}
 ]
+REQUIREMENTS_BY_TYPE = MappingProxyType({req['type']: req for req in IMAGE_REQUIREMENTS})
+VALID_IMAGE_TYPES = frozenset(REQUIREMENTS_BY_TYPE)
+REQUIRED_IMAGE_COUNT = len(IMAGE_REQUIREMENTS)
+
+PROMPTS = MappingProxyType({
+    "front": "Does this image clearly show the entire front of a vehicle? Check for: full view, no obstructions, good lighting. Answer with exactly one word: YES or NO.",
+    "back": "Does this image clearly show the entire rear of a vehicle? Check for: full view, no obstructions, visible license plate. Answer with exactly one word: YES or NO.",
+    "left": "Does this image show the complete left side of a vehicle? Check for: full side profile, no obstructions. Answer with exactly one word: YES or NO.",
+    "right": "Does this image show the complete right side of a vehicle? Check for: full side profile, no obstructions. Answer with exactly one word: YES or NO.",
+    "engine": "Does this image clearly show the engine compartment? Check for: clear view of engine components. Answer with exactly one word: YES or NO.",
+    "dashboard": "Does this image show the vehicle dashboard with visible odometer reading? Check for: clear numbers. Answer with exactly one word: YES or NO.",
+    "vin": "Does this image show a vehicle's VIN plate with readable characters? Check for: all characters legible. Answer with exactly one word: YES or NO.",
+    "registration": "Does this image show a current vehicle registration document? Check for: readable text, current dates. Answer with exactly one word: YES or NO."
+})
 
 # Helper functions
-def validate_image_with_ai(image_path: str, image_type: str) -> dict:
-    """Validate the image using Ollama's vision model"""
-    prompts = {
-        "front": "Does this image clearly show the entire front of a vehicle? Check for: full view, no obstructions, good lighting.",
-        "back": "Does this image clearly show the entire rear of a vehicle? Check for: full view, no obstructions, visible license plate.",
-        "left": "Does this image show the complete left side of a vehicle? Check for: full side profile, no obstructions.",
-        "right": "Does this image show the complete right side of a vehicle? Check for: full side profile, no obstructions.",
-        "engine": "Does this image clearly show the engine compartment? Check for: clear view of engine components.",
-        "dashboard": "Does this image show the vehicle dashboard with visible odometer reading? Check for: clear numbers.",
-        "vin": "Does this image show a vehicle's VIN plate with readable characters? Check for: all characters legible.",
-        "registration": "Does this image show a current vehicle registration document? Check for: readable text, current dates."
+async def save_upload(file: UploadFile, filepath: str):
+    """Stream an uploaded file to disk chunk by chunk"""
+    try:
+        async with aiofiles.open(filepath, "wb") as out:
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                await out.write(chunk)
+    except BaseException:
+        # Don't leave a truncated image behind for the report to pick up
+        with suppress(FileNotFoundError):
+            await aiofiles.os.remove(filepath)
+        raise
+
+def thumbnail_path(image_path: str) -> str:
+    return f"{image_path}.thumb.jpg"
+
+def upload_url(path: Optional[str]) -> Optional[str]:
+    """URL of a file in the uploads folder as served by the static mount"""
+    return f"/uploads/{os.path.basename(path)}" if path else None
+
+def make_thumbnail(image_path: str) -> Optional[str]:
+    """Save a downscaled copy of the image for the PDF report and list views"""
+    thumb = thumbnail_path(image_path)
+    try:
+        with Image.open(image_path) as img:
+            img.thumbnail(THUMBNAIL_SIZE, Image.LANCZOS)
+            img.convert("RGB").save(thumb, "JPEG", quality=85, optimize=True)
+        return thumb
+    except Exception:
+        # Pillow reports broken files with OSError, SyntaxError, ValueError and more;
+        # the image just gets no thumbnail, and none left over from a previous upload
+        if os.path.exists(thumb):
+            os.remove(thumb)
+        return None
+
+@lru_cache(maxsize=64)
+def _cached_thumbnail(path: str, mtime: float) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+def load_report_image(image_path: str, thumb_path: Optional[str]) -> ImageReader:
+    """Return an image for the report, preferring the thumbnail"""
+    if thumb_path and os.path.exists(thumb_path):
+        # ImageReader keeps a file position, so renders running in parallel
+        # threads each get their own reader over the shared cached bytes.
+        # Re-uploads overwrite the same path, so the mtime keeps the cache honest
+        return ImageReader(BytesIO(_cached_thumbnail(thumb_path, os.path.getmtime(thumb_path))))
+    return ImageReader(image_path)
+
+def validation_result(image_type: str, valid: bool) -> dict:
+    """Build the validation dict returned to clients and stored with the image"""
+    if valid:
+        return {"valid": True, "reason": "Valid image"}
+    return {
+        "valid": False,
+        "reason": f"Does not meet requirement: {REQUIREMENTS_BY_TYPE[image_type]['description']}"
     }
-    
+
+async def validate_image_with_ai(image_path: str, image_type: str) -> dict:
+    """Validate the image using Ollama's vision model"""
     try:
-        response = ollama.chat(
-            model='llava:latest',
-            messages=[{
-                'role': 'user',
-                'content': prompts[image_type],
-                'images': [image_path]
-            }]
-        )
+        async with OLLAMA_SEM:
+            response = await app.state.ollama.chat(
+                model=MODEL,
+                keep_alive=OLLAMA_KEEP_ALIVE,
+                options={'num_predict': 8, 'temperature': 0.0},
+                messages=[{
+                    'role': 'user',
+                    'content': PROMPTS[image_type],
+                    'images': [image_path]
+                }]
+            )
         
-        content = response['message']['content'].lower().strip()
+        content = response['message']['content'].strip().upper()
         
-        return {
-            "valid": "yes" in content or "valid" in content,
-            "reason": content if "no" in content or "invalid" in content else "Valid image"
-        }
+        return validation_result(image_type, content.startswith("YES"))
     except Exception as e:
         return {"valid": False, "reason": f"Validation error: {str(e)}"}
 
+async def validate_images_with_ai(images: List[tuple]) -> List[dict]:
+    """Validate several images with a single request to Ollama's vision model
+
+    Falls back to one request per image when BATCH_VALIDATION is off, and
+    for anything the model did not answer in the expected JSON shape.
+    """
+    if len(images) == 1 or not BATCH_VALIDATION:
+        return [await validate_image_with_ai(*image) for image in images]
+
+    checklist = "\n".join(
+        f"Image {i}, key \"{image_type}\": {REQUIREMENTS_BY_TYPE[image_type]['description']}"
+        for i, (_, image_type) in enumerate(images, start=1)
+    )
+    prompt = (
+        f"You are given {len(images)} vehicle inspection photos, in order. "
+        "For each image decide whether it meets its requirement:\n"
+        f"{checklist}\n"
+        "Reply only with a JSON object mapping each key to \"yes\" or \"no\", "
+        "for example {\"front\": \"yes\", \"back\": \"no\"}."
+    )
+
+    answers = {}
+    try:
+        # Released before the per-image fallback below, which takes it again per call
+        async with OLLAMA_SEM:
+            response = await app.state.ollama.chat(
+                model=MODEL,
+                format='json',
+                keep_alive=OLLAMA_KEEP_ALIVE,
+                options={'num_predict': 16 * len(images), 'temperature': 0.0},
+                messages=[{
+                    'role': 'user',
+                    'content': prompt,
+                    'images': [image_path for image_path, _ in images]
+                }]
+            )
+        answers = json.loads(response['message']['content'])
+    except Exception:
+        pass
+
+    results = []
+    for image_path, image_type in images:
+        answer = answers.get(image_type) if isinstance(answers, dict) else None
+        if not isinstance(answer, str):
+            results.append(await validate_image_with_ai(image_path, image_type))
+        else:
+            results.append(validation_result(image_type, answer.strip().upper().startswith("YES")))
+    return results
+
+def parse_id(value: str) -> bytes:
+    """Convert a hex id from a URL back into the 16-byte key stored in the database"""
+    try:
+        key = bytes.fromhex(value)
+    except ValueError:
+        key = b""
+    if len(key) != 16:
+        raise HTTPException(status_code=404, detail="Submission not found")
+    return key
+
+def insert_image(conn, submission_id: bytes, image_type: str, filepath: str, thumb_path: Optional[str], validation: dict) -> str:
+    """Insert an image row and return its id"""
+    return conn.execute(
+        "INSERT INTO submission_images (id, submission_id, image_type, image_path, thumb_path, validation_result, validation_reason) "
+        "VALUES (randomblob(16), ?, ?, ?, ?, ?, ?) RETURNING lower(hex(id))",
+        (submission_id, image_type, filepath, thumb_path,
+         1 if validation['valid'] else 0, validation['reason'])
+    ).fetchone()[0]
+
+def update_submission_status(conn, submission_id: bytes):
+    """Mark the submission complete once every required image is present"""
+    conn.execute(
+        "UPDATE submissions SET status = 'complete' WHERE id = ? "
+        "AND (SELECT COUNT(*) FROM submission_images WHERE submission_id = ?) >= ?",
+        (submission_id, submission_id, REQUIRED_IMAGE_COUNT)
+    )
+
 def generate_pdf_report(submission_id: str):
     """Generate a PDF report for the submission"""
-    with get_db() as conn:
-        submission = conn.execute(
-            "SELECT * FROM submissions WHERE id = ?", (submission_id,)
-        ).fetchone()
-        
-        images = conn.execute(
-            "SELECT * FROM submission_images WHERE submission_id = ?", (submission_id,)
+    with get_reader() as conn:
+        rows = conn.execute(
+            "SELECT s.*, si.image_type, si.image_path, si.thumb_path, si.validation_result, si.validation_reason "
+            "FROM submissions s LEFT JOIN submission_images si ON si.submission_id = s.id "
+            "WHERE s.id = ?", (bytes.fromhex(submission_id),)
         ).fetchall()
     
-    filename = f"reports/{submission_id}.pdf"
-    os.makedirs("reports", exist_ok=True)
+    if not rows:
+        raise HTTPException(status_code=404, detail="Submission not found")
+    # Every row repeats the submission columns; a submission without images yields one NULL image row
+    submission = rows[0]
+    images = [row for row in rows if row['image_path'] is not None]
+    
+    # Images never change after upload, so a report is only stale once a new one arrives
+    version = hashlib.sha1(f"{submission_id}:{submission['last_modified']}".encode()).hexdigest()[:16]
+    filename = os.path.join(REPORTS_FOLDER, f"{submission_id}_{version}.pdf")
+    if os.path.exists(filename):
+        return filename
     
-    c = canvas.Canvas(filename, pagesize=letter)
+    tmp_filename = f"{filename}.{uuid.uuid4().hex}.tmp"
+    c = canvas.Canvas(tmp_filename, pagesize=letter)
     width, height = letter
     
     # Header
@@ -166,42 +471,84 @@ def generate_pdf_report(submission_id: str):
     c.drawString(72, height - 120, f"Vehicle: {submission['vehicle_year']} {submission['vehicle_make']} {submission['vehicle_model']}")
     c.drawString(72, height - 140, f"Submission Date: {submission['created_at']}")
     
-    # Images
-    y_position = height - 180
+    # Images that can't be read are skipped without taking up a slot
+    drawable = []
     for img in images:
-        if y_position < 200:
-            c.showPage()
-            y_position = height - 72
-            
         try:
-            img_reader = ImageReader(img['image_path'])
-            c.drawImage(img_reader, 72, y_position - 120, width=200, height=150, preserveAspectRatio=True)
-            c.setFont("Helvetica-Bold", 12)
-            c.drawString(300, y_position - 80, img['image_type'].capitalize())
-            c.setFont("Helvetica", 10)
-            c.drawString(300, y_position - 100, f"Status: {'Valid' if img['validation_result'] == 'yes' else 'Invalid'}")
-            c.drawString(300, y_position - 120, f"Notes: {img['validation_reason']}")
-            y_position -= 180
-        except:
+            img_reader = load_report_image(img['image_path'], img['thumb_path'])
+            # Only JPEGs are checked on open; decode anything else now so a
+            # broken file is skipped here rather than failing in drawImage
+            if img_reader.jpeg_fh() is None:
+                img_reader.getRGBData()
+            drawable.append((img, img_reader))
+        except Exception:
             continue
     
+    # Lay out every slot up front so each page switches fonts only once per style
+    pages = [[]]
+    y_position = height - 180
+    for img, img_reader in drawable:
+        if y_position < 200:
+            pages.append([])
+            y_position = height - 72
+        pages[-1].append((y_position, img, img_reader))
+        y_position -= 180
+    
+    for page_number, slots in enumerate(pages):
+        if page_number:
+            c.showPage()
+        
+        for y, img, img_reader in slots:
+            c.drawImage(img_reader, 72, y - 120, width=200, height=150, preserveAspectRatio=True)
+        
+        c.setFont("Helvetica-Bold", 12)
+        for y, img, _ in slots:
+            c.drawString(300, y - 80, img['image_type'].capitalize())
+        
+        text = c.beginText()
+        text.setFont("Helvetica", 10, leading=20)
+        for y, img, _ in slots:
+            text.setTextOrigin(300, y - 100)
+            text.textLine(f"Status: {'Valid' if img['validation_result'] else 'Invalid'}")
+            text.textLine(f"Notes: {img['validation_reason']}")
+        c.drawText(text)
+    
     c.save()
+    os.replace(tmp_filename, filename)
     return filename
 
+def render_report(submission_id: str, attempts: int = 3) -> tuple:
+    """Return the path and stat of an up-to-date report for the submission"""
+    for _ in range(attempts - 1):
+        pdf_path = generate_pdf_report(submission_id)
+        try:
+            return pdf_path, os.stat(pdf_path)
+        except FileNotFoundError:
+            # An upload purged this version after it was rendered; render the new one
+            continue
+    pdf_path = generate_pdf_report(submission_id)
+    return pdf_path, os.stat(pdf_path)
+
+def purge_reports(submission_id: str):
+    """Delete cached reports rendered before the latest upload"""
+    for path in glob.glob(os.path.join(REPORTS_FOLDER, f"{glob.escape(submission_id)}_*.pdf")):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
 # API Endpoints
 @app.post("/api/submissions")
 async def create_submission(data: SubmissionCreate, token: str = Depends(oauth2_scheme)):
     """Create a new vehicle submission"""
-    submission_id = str(uuid.uuid4())
     created_at = datetime.now().isoformat()
     
-    with get_db() as conn:
-        conn.execute(
-            "INSERT INTO submissions (id, user_id, vehicle_make, vehicle_model, vehicle_year, status, created_at) "
-            "VALUES (?, ?, ?, ?, ?, ?, ?)",
-            (submission_id, token, data.vehicle_make, data.vehicle_model, data.vehicle_year, "pending", created_at)
-        )
-        conn.commit()
+    async with get_writer() as conn:
+        submission_id = conn.execute(
+            "INSERT INTO submissions (id, user_id, vehicle_make, vehicle_model, vehicle_year, status, created_at, last_modified) "
+            "VALUES (randomblob(16), ?, ?, ?, ?, ?, ?, ?) RETURNING lower(hex(id))",
+            (token, data.vehicle_make, data.vehicle_model, data.vehicle_year, "pending", created_at, created_at)
+        ).fetchone()[0]
     
     return JSONResponse({
         "id": submission_id,
@@ -216,8 +563,11 @@ async def upload_image(
     file: UploadFile = File(...)
 ):
     """Upload and validate an image for a submission"""
+    submission_key = parse_id(submission_id)
+    submission_id = submission_key.hex()
+    
     # Validate image type
-    if not any(req['type'] == image_type for req in IMAGE_REQUIREMENTS):
+    if image_type not in VALID_IMAGE_TYPES:
         raise HTTPException(status_code=400, detail="Invalid image type")
     
     # Save file
@@ -225,50 +575,100 @@ async def upload_image(
     filename = f"{submission_id}_{image_type}{file_ext}"
     filepath = os.path.join(UPLOAD_FOLDER, filename)
     
-    with open(filepath, "wb") as buffer:
-        buffer.write(await file.read())
+    await save_upload(file, filepath)
+    thumb_path = await asyncio.to_thread(make_thumbnail, filepath)
     
     # Validate with AI
-    validation = validate_image_with_ai(filepath, image_type)
+    validation = await validate_image_with_ai(filepath, image_type)
     
     # Save to database
-    image_id = str(uuid.uuid4())
-    with get_db() as conn:
-        conn.execute(
-            "INSERT INTO submission_images (id, submission_id, image_type, image_path, validation_result, validation_reason) "
-            "VALUES (?, ?, ?, ?, ?, ?)",
-            (image_id, submission_id, image_type, filepath, 
-             "yes" if validation['valid'] else "no", validation['reason'])
-        )
-        
-        # Check if submission is complete
-        images = conn.execute(
-            "SELECT COUNT(*) as count FROM submission_images WHERE submission_id = ?", (submission_id,)
-        ).fetchone()
-        
-        if images['count'] >= len(IMAGE_REQUIREMENTS):
-            conn.execute(
-                "UPDATE submissions SET status = 'complete' WHERE id = ?", (submission_id,)
-            )
-        
-        conn.commit()
+    async with get_writer() as conn:
+        image_id = insert_image(conn, submission_key, image_type, filepath, thumb_path, validation)
+        update_submission_status(conn, submission_key)
+    purge_reports(submission_id)
     
     return JSONResponse({
         "id": image_id,
         "valid": validation['valid'],
         "reason": validation['reason'],
-        "image_url": f"/uploads/{filename}"
+        "image_url": f"/uploads/{filename}",
+        "thumbnail_url": upload_url(thumb_path)
     })
 
+@app.post("/api/submissions/{submission_id}/upload_batch")
+async def upload_images(
+    submission_id: str,
+    image_types: List[str] = Query(...),
+    files: List[UploadFile] = File(...)
+):
+    """Upload several images and validate them with one model request"""
+    submission_key = parse_id(submission_id)
+    submission_id = submission_key.hex()
+    
+    if len(image_types) != len(files):
+        raise HTTPException(status_code=400, detail="Each file needs exactly one image type")
+    if len(set(image_types)) != len(image_types):
+        raise HTTPException(status_code=400, detail="Duplicate image type")
+    if not VALID_IMAGE_TYPES.issuperset(image_types):
+        raise HTTPException(status_code=400, detail="Invalid image type")
+    
+    # Save files
+    saved = []
+    for image_type, file in zip(image_types, files):
+        file_ext = os.path.splitext(file.filename)[1]
+        filename = f"{submission_id}_{image_type}{file_ext}"
+        filepath = os.path.join(UPLOAD_FOLDER, filename)
+        await save_upload(file, filepath)
+        thumb_path = await asyncio.to_thread(make_thumbnail, filepath)
+        saved.append((filepath, thumb_path, image_type, filename))
+    
+    # Validate with AI
+    validations = await validate_images_with_ai(
+        [(filepath, image_type) for filepath, _, image_type, _ in saved]
+    )
+    
+    # Save to database
+    results = []
+    async with get_writer() as conn:
+        for (filepath, thumb_path, image_type, filename), validation in zip(saved, validations):
+            image_id = insert_image(conn, submission_key, image_type, filepath, thumb_path, validation)
+            results.append({
+                "id": image_id,
+                "image_type": image_type,
+                "valid": validation['valid'],
+                "reason": validation['reason'],
+                "image_url": f"/uploads/{filename}",
+                "thumbnail_url": upload_url(thumb_path)
+            })
+        update_submission_status(conn, submission_key)
+    purge_reports(submission_id)
+    
+    return JSONResponse({"images": results})
+
 @app.get("/api/submissions/{submission_id}/report")
-async def get_submission_report(submission_id: str):
+async def get_submission_report(submission_id: str, request: Request):
     """Generate and download a PDF report"""
-    pdf_path = generate_pdf_report(submission_id)
-    return FileResponse(pdf_path, filename=f"insurance_report_{submission_id}.pdf")
+    submission_id = parse_id(submission_id).hex()
+    pdf_path, stat_result = await asyncio.to_thread(render_report, submission_id)
+    
+    # The cached file name already identifies the submission version it was rendered from
+    headers = {
+        "ETag": f'"{os.path.splitext(os.path.basename(pdf_path))[0]}"',
+        "Cache-Control": "no-cache",
+    }
+    if request.headers.get("if-none-match") == headers["ETag"]:
+        return Response(status_code=304, headers=headers)
+    
+    return FileResponse(
+        pdf_path,
+        filename=f"insurance_report_{submission_id}.pdf",
+        headers=headers,
+        stat_result=stat_result
+    )
 
 # Serve static files
 app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
-app.mount("/reports", StaticFiles(directory="reports"), name="reports")
+app.mount("/reports", StaticFiles(directory=REPORTS_FOLDER), name="reports")
 
 if __name__ == "__main__":
     import uvicorn